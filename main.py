@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import re
+from collections.abc import Iterable
 from dataclasses import dataclass
-from typing import Any
+from functools import lru_cache
+from itertools import chain
+from typing import Any, NamedTuple
 
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent, filter
@@ -14,16 +17,28 @@ from astrbot.core.star.star import star_map
 VERSION = "0.3.0"
 
 
-@dataclass(frozen=True)
-class MappingEntry:
+class MappingEntry(NamedTuple):
     alias_raw: str
     target_raw: str
     reply_mode: str
     reply_text: str
+    alias_norm: str = ""
+    target_norm: str = ""
+
+
+@dataclass(frozen=True, slots=True)
+class _MappingTable:
+    # alias_norm -> (target_norm, reply_mode, reply_text)
+    entries: dict[str, tuple[str, str, str]]
+    pattern: re.Pattern[str] | None
 
 
 APPLIED_KEY = "__astrbot_plugin_cmdmask:applied"
-WHITESPACE_PATTERN = re.compile(r"\s+")
+# (reply_mode, reply_text)，仅在需要改写回复时写入
+REPLY_KEY = "__astrbot_plugin_cmdmask:reply"
+REPLY_MODE_KEYS = frozenset({"reply_mode", "回复模式"})
+REPLY_TEXT_KEYS = frozenset({"reply", "reply_text", "回复", "回复文本", "text", "文本"})
+COMMON_PREFIX_PATTERN = re.compile("[/.!！。]")
 REPLY_MODE_MAP = {
     "silent": "silent",
     "mute": "silent",
@@ -32,8 +47,7 @@ REPLY_MODE_MAP = {
     "default": "keep",
     "passthrough": "keep",
     "custom": "custom",
-}
-REPLY_MODE_CN_MAP = {
+    # 中文别名没有大小写之分，合并后统一用 lower() 查一次表
     "静默": "silent",
     "不回复": "silent",
     "不回": "silent",
@@ -47,7 +61,14 @@ REPLY_MODE_CN_MAP = {
 
 
 def _normalize_text(text: str) -> str:
-    return WHITESPACE_PATTERN.sub(" ", text.strip())
+    # str.split() 一次完成去首尾空白与合并连续空白
+    return " ".join(text.split())
+
+
+def _is_clean(text: str) -> bool:
+    """判断文本是否已是 _normalize_text 的结果，避免重复归一化。"""
+    # isprintable() 为真时，唯一可能出现的空白字符就是 ASCII 空格
+    return text.isprintable() and "  " not in text and text == text.strip()
 
 
 def _read_str(value: Any) -> str:
@@ -62,36 +83,45 @@ def _read_text(value: Any) -> str:
     return str(value).strip()
 
 
-def _get_wake_prefixes(cfg: AstrBotConfig) -> list[str]:
+def _get_wake_prefixes(cfg: AstrBotConfig) -> tuple[str, ...]:
     prefixes = cfg.get("wake_prefix", [])
     if isinstance(prefixes, str):
         prefixes = [prefixes]
     if not isinstance(prefixes, list):
-        return []
-    return [p for p in prefixes if isinstance(p, str) and p]
+        return ()
+    return _sort_wake_prefixes(tuple(p for p in prefixes if isinstance(p, str) and p))
+
+
+@lru_cache(maxsize=32)
+def _sort_wake_prefixes(prefixes: tuple[str, ...]) -> tuple[str, ...]:
+    # 长的前缀优先，避免 "/" 抢先匹配 "//" 之类的前缀
+    return tuple(sorted(prefixes, key=len, reverse=True))
 
 
 def _strip_wake_prefix(
-    text: str, prefixes: list[str], strip_common: bool = False
+    text: str, prefixes: tuple[str, ...], strip_common: bool = False
 ) -> str:
     """去掉文本开头的 wake_prefix。
 
     Args:
         text: 输入文本
-        prefixes: 用户配置的 wake_prefix 列表
+        prefixes: 用户配置的 wake_prefix，按长度降序排列
         strip_common: 是否同时去掉常见命令前缀（仅用于配置归一化）
     """
     # 先尝试去掉用户配置的 prefixes
-    for prefix in prefixes:
-        if prefix and text.startswith(prefix):
-            return text[len(prefix) :].strip()
+    pattern = _compile_prefix_pattern(prefixes)
+    match = pattern.match(text) if pattern else None
     # 仅在配置归一化时，再尝试去掉常见的命令前缀
-    if strip_common:
-        common_prefixes = ["/", ".", "!", "！", "。"]
-        for prefix in common_prefixes:
-            if text.startswith(prefix):
-                return text[len(prefix) :].strip()
-    return text
+    if match is None and strip_common:
+        match = COMMON_PREFIX_PATTERN.match(text)
+    return text[match.end() :].strip() if match else text
+
+
+@lru_cache(maxsize=32)
+def _compile_prefix_pattern(prefixes: tuple[str, ...]) -> re.Pattern[str] | None:
+    if not prefixes:
+        return None
+    return re.compile("|".join(re.escape(prefix) for prefix in prefixes))
 
 
 def _normalize_reply_mode(value: Any) -> str:
@@ -100,12 +130,7 @@ def _normalize_reply_mode(value: Any) -> str:
     text = str(value).strip()
     if not text:
         return "keep"
-    lower = text.lower()
-    if lower in REPLY_MODE_MAP:
-        return REPLY_MODE_MAP[lower]
-    if text in REPLY_MODE_CN_MAP:
-        return REPLY_MODE_CN_MAP[text]
-    return "keep"
+    return REPLY_MODE_MAP.get(text.lower(), "keep")
 
 
 def _parse_reply_option(opt_strip: str) -> tuple[str | None, str | None]:
@@ -113,26 +138,20 @@ def _parse_reply_option(opt_strip: str) -> tuple[str | None, str | None]:
         return None, None
     lower = opt_strip.lower()
 
-    if lower in REPLY_MODE_MAP:
-        return REPLY_MODE_MAP[lower], None
-    if opt_strip in REPLY_MODE_CN_MAP:
-        return REPLY_MODE_CN_MAP[opt_strip], None
-
-    if lower.startswith("reply_mode=") or opt_strip.startswith("回复模式="):
-        mode = opt_strip.split("=", 1)[1].strip()
-        return _normalize_reply_mode(mode), None
-
-    if (
-        lower.startswith("reply=")
-        or lower.startswith("reply_text=")
-        or opt_strip.startswith("回复=")
-        or opt_strip.startswith("回复文本=")
-    ):
-        return "custom", opt_strip.split("=", 1)[1].strip()
-    if lower.startswith("text=") or opt_strip.startswith("文本="):
-        return "custom", opt_strip.split("=", 1)[1].strip()
-    if opt_strip.startswith("回复:"):
-        return "custom", opt_strip.split(":", 1)[1].strip()
+    mode = REPLY_MODE_MAP.get(lower)
+    if mode is not None:
+        return mode, None
+
+    key, sep, value = opt_strip.partition("=")
+    if sep:
+        key = key.lower()
+        if key in REPLY_MODE_KEYS:
+            return _normalize_reply_mode(value), None
+        if key in REPLY_TEXT_KEYS:
+            return "custom", value.strip()
+    key, sep, value = opt_strip.partition(":")
+    if sep and key == "回复":
+        return "custom", value.strip()
 
     return "custom", opt_strip
 
@@ -144,13 +163,11 @@ def _parse_mapping_line(line: str) -> MappingEntry | None:
     if not parts:
         return None
 
-    mapping_part = parts[0]
-    if "=>" in mapping_part:
-        target_raw, alias_raw = mapping_part.split("=>", 1)
-    elif "->" in mapping_part:
-        target_raw, alias_raw = mapping_part.split("->", 1)
-    else:
-        return None
+    target_raw, sep, alias_raw = parts[0].partition("=>")
+    if not sep:
+        target_raw, sep, alias_raw = parts[0].partition("->")
+        if not sep:
+            return None
 
     alias_raw = alias_raw.strip()
     target_raw = target_raw.strip()
@@ -274,7 +291,7 @@ def _build_mappings_from_text(text: str) -> list[MappingEntry]:
         line = raw.strip()
         if not line:
             continue
-        if line.startswith("#") or line.startswith("//") or line.startswith(";"):
+        if line.startswith(("#", "//", ";")):
             continue
         entry = _parse_mapping_line(line)
         if entry:
@@ -282,94 +299,125 @@ def _build_mappings_from_text(text: str) -> list[MappingEntry]:
     return mappings
 
 
+def _trie_to_pattern(node: dict[str, Any]) -> str:
+    branches: list[str] = []
+    for char, child in node.items():
+        if not char:
+            continue
+        # 合并没有分叉的单链，减少分组与递归层数
+        run = [char]
+        while len(child) == 1 and "" not in child:
+            next_char, child = next(iter(child.items()))
+            run.append(next_char)
+        branches.append(re.escape("".join(run)) + _trie_to_pattern(child))
+    if "" in node:
+        # 空分支放在最后：先尝试更长的伪装指令，失败再回溯到当前结尾
+        branches.append("")
+    if len(branches) == 1:
+        return branches[0]
+    return f"(?:{'|'.join(branches)})"
+
+
+def _build_alias_pattern(aliases: Iterable[str]) -> re.Pattern[str]:
+    """把伪装指令合并成前缀树形状的正则。
+
+    公共前缀只比较一次，匹配代价与消息长度相关，而不随规则数量线性增长。
+    """
+    trie: dict[str, Any] = {}
+    for alias in aliases:
+        node = trie
+        for char in alias:
+            node = node.setdefault(char, {})
+        node[""] = True
+    # 匹配：完全相等，或 alias 后跟任意空白字符
+    return re.compile(rf"^{_trie_to_pattern(trie)}(?=\s|$)")
+
+
+def _build_mapping_table(
+    mappings: list[MappingEntry], prefixes: tuple[str, ...]
+) -> _MappingTable:
+    """按 wake_prefix 归一化映射，并把所有伪装指令编译为一个正则。
+
+    归一化后为空的规则会被丢弃；伪装指令重复时以先出现的为准，
+    互为前缀时最长匹配优先。
+    """
+    entries: dict[str, tuple[str, str, str]] = {}
+    for entry in mappings:
+        # 配置归一化：去掉常见命令前缀
+        alias_norm = _strip_wake_prefix(entry.alias_norm, prefixes, strip_common=True)
+        target_norm = _strip_wake_prefix(entry.target_norm, prefixes, strip_common=True)
+        if not alias_norm or not target_norm:
+            continue
+        kept = entries.get(alias_norm)
+        if kept is not None:
+            logger.warning(
+                f"[CmdMask] duplicate alias {alias_norm!r}: keeping "
+                f"{kept[0]!r}, ignoring {target_norm!r}",
+            )
+            continue
+        entries[alias_norm] = (target_norm, entry.reply_mode, entry.reply_text)
+    if not entries:
+        return _MappingTable(entries={}, pattern=None)
+    return _MappingTable(entries=entries, pattern=_build_alias_pattern(entries))
+
+
 def _apply_mapping(
     event: AstrMessageEvent,
-    cfg: AstrBotConfig,
-    enabled: bool,
-    mappings: list[MappingEntry],
+    prefixes: tuple[str, ...],
+    table: _MappingTable,
 ) -> bool:
-    if not enabled or not mappings:
+    """table 须为 _build_mapping_table 按同一 prefixes 建立的映射表。"""
+    if table.pattern is None:
         return False
 
-    raw_msg = _normalize_text(event.get_message_str())
+    original_msg = event.get_message_str() or ""
+    raw_msg = original_msg
+    if not _is_clean(raw_msg):
+        raw_msg = _normalize_text(raw_msg)
     if not raw_msg:
         return False
 
-    prefixes = _get_wake_prefixes(cfg)
-
-    # 检测用户实际使用的前缀
-    # 优先从 message_obj.message_str 获取原始消息（未被处理）
-    original_msg = ""
-    if (
-        hasattr(event, "message_obj")
-        and event.message_obj
-        and hasattr(event.message_obj, "message_str")
-    ):
-        original_msg = event.message_obj.message_str or ""
-    if not original_msg:
-        original_msg = raw_msg
-
-    used_prefix = ""
-    for prefix in prefixes:
-        if prefix and original_msg.startswith(prefix):
-            used_prefix = prefix
-            break
-
     msg = _strip_wake_prefix(raw_msg, prefixes)  # 去掉 wake_prefix 后再匹配
 
-    for entry in mappings:
-        # 配置归一化：去掉常见命令前缀
-        alias_norm = _strip_wake_prefix(
-            _normalize_text(entry.alias_raw), prefixes, strip_common=True
-        )
-        if not alias_norm:
-            continue
-        # 匹配：完全相等，或 alias 后跟任意空白字符
-        if msg == alias_norm or (
-            msg.startswith(alias_norm)
-            and len(msg) > len(alias_norm)
-            and msg[len(alias_norm)].isspace()
-        ):
-            # 配置归一化：去掉常见命令前缀
-            target_norm = _strip_wake_prefix(
-                _normalize_text(entry.target_raw),
-                prefixes,
-                strip_common=True,
-            )
-            if not target_norm:
-                continue
-            suffix = msg[len(alias_norm) :].strip()
-            # 重写消息：直接使用 target_norm（不加前缀）
-            # 因为 AstrBot 已经在 event.message_str 中去掉了 wake_prefix
-            # CommandFilter 也期望不带前缀的命令名（如 "reset" 而不是 ".reset"）
-            new_msg = target_norm
-            if suffix:
-                new_msg = f"{new_msg} {suffix}"
-
-            logger.info(f"[CmdMask] rewriting: {event.message_str!r} -> {new_msg!r}")
-
-            event.set_extra(APPLIED_KEY, True)
-            event.set_extra("__astrbot_plugin_cmdmask:reply_mode", entry.reply_mode)
-            event.set_extra("__astrbot_plugin_cmdmask:reply_text", entry.reply_text)
-            event.set_extra("__astrbot_plugin_cmdmask:alias", alias_norm)
-            event.set_extra("__astrbot_plugin_cmdmask:target", target_norm)
-            event.set_extra(
-                "__astrbot_plugin_cmdmask:original_message", event.get_message_str()
-            )
-
-            if new_msg != event.message_str:
-                event.message_str = new_msg
-                if (
-                    hasattr(event, "message_obj")
-                    and event.message_obj
-                    and hasattr(event.message_obj, "message_str")
-                ):
-                    event.message_obj.message_str = new_msg
-
-            event.should_call_llm(True)
-            return True
+    match = table.pattern.match(msg)
+    if match is None:
+        return False
 
-    return False
+    alias_norm = match.group()
+    target_norm, reply_mode, reply_text = table.entries[alias_norm]
+    suffix = msg[match.end() :].strip()
+    # 重写消息：直接使用 target_norm（不加前缀）
+    # 因为 AstrBot 已经在 event.message_str 中去掉了 wake_prefix
+    # CommandFilter 也期望不带前缀的命令名（如 "reset" 而不是 ".reset"）
+    new_msg = target_norm
+    if suffix:
+        new_msg = f"{new_msg} {suffix}"
+
+    logger.info(f"[CmdMask] rewriting: {event.message_str!r} -> {new_msg!r}")
+
+    # 只保护改写事件的部分，匹配流程本身不会抛出异常
+    try:
+        event.set_extra(APPLIED_KEY, True)
+        if reply_mode != "keep":
+            event.set_extra(REPLY_KEY, (reply_mode, reply_text))
+        event.set_extra("__astrbot_plugin_cmdmask:alias", alias_norm)
+        event.set_extra("__astrbot_plugin_cmdmask:target", target_norm)
+        event.set_extra("__astrbot_plugin_cmdmask:original_message", original_msg)
+
+        if new_msg != event.message_str:
+            event.message_str = new_msg
+            if (
+                hasattr(event, "message_obj")
+                and event.message_obj
+                and hasattr(event.message_obj, "message_str")
+            ):
+                event.message_obj.message_str = new_msg
+
+        event.should_call_llm(True)
+    except Exception as exc:
+        logger.warning(f"[CmdMask] mapping error: {exc}")
+        return False
+    return True
 
 
 class _CommandMaskFilter(CustomFilter):
@@ -378,13 +426,11 @@ class _CommandMaskFilter(CustomFilter):
         plugin = plugin_md.star_cls if plugin_md else None
         if not isinstance(plugin, CmdMask):
             return False
-        logger.debug(
-            f"[CmdMask] filter called, enabled={plugin._enabled}, mappings_count={len(plugin._mappings)}",
-        )
-        try:
-            _apply_mapping(event, cfg, plugin._enabled, plugin._mappings)
-        except Exception as exc:
-            logger.warning(f"[CmdMask] mapping error: {exc}")
+        # 未启用或没有映射时直接返回，不读取配置也不调用 _apply_mapping
+        if not plugin._enabled or not plugin._mappings:
+            return False
+        prefixes = _get_wake_prefixes(cfg)
+        _apply_mapping(event, prefixes, plugin._get_table(prefixes))
         return False
 
 
@@ -398,6 +444,8 @@ class CmdMask(Star):
         self._config = config
         self._enabled = True
         self._mappings: list[MappingEntry] = []
+        # 按 wake_prefix 缓存归一化后的映射，配置重载时清空
+        self._tables: dict[tuple[str, ...], _MappingTable] = {}
         self._load_config()
         logger.info(
             f"[CmdMask] loaded v{VERSION} with {len(self._mappings)} mappings",
@@ -418,19 +466,36 @@ class CmdMask(Star):
         if not isinstance(raw_mappings, list):
             raw_mappings = []
 
-        mappings: list[MappingEntry] = []
-        reset_entry = _build_fixed_mapping("/reset", reset_rule)
-        if reset_entry:
-            mappings.append(reset_entry)
-        new_entry = _build_fixed_mapping("/new", new_rule)
-        if new_entry:
-            mappings.append(new_entry)
-        mappings.extend(_build_custom_mappings(custom_rules))
-        mappings.extend(_build_mappings_from_text(rules_text))
-        mappings.extend(_build_mappings(raw_mappings))
+        sources = chain(
+            (
+                _build_fixed_mapping("/reset", reset_rule),
+                _build_fixed_mapping("/new", new_rule),
+            ),
+            _build_custom_mappings(custom_rules),
+            _build_mappings_from_text(rules_text),
+            _build_mappings(raw_mappings),
+        )
+        # 先构建完整列表再一次性替换，重载期间不会暴露半成品
+        # 重复的伪装指令在 _build_mapping_table 中按最终匹配用的键去重
+        mappings = [
+            entry._replace(
+                alias_norm=_normalize_text(entry.alias_raw),
+                target_norm=_normalize_text(entry.target_raw),
+            )
+            for entry in sources
+            if entry
+        ]
 
         self._enabled = enabled
         self._mappings = mappings
+        self._tables.clear()
+
+    def _get_table(self, prefixes: tuple[str, ...]) -> _MappingTable:
+        table = self._tables.get(prefixes)
+        if table is None:
+            table = _build_mapping_table(self._mappings, prefixes)
+            self._tables[prefixes] = table
+        return table
 
     @filter.custom_filter(_CommandMaskFilter)
     @filter.event_message_type(filter.EventMessageType.ALL, priority=100000)
@@ -439,19 +504,16 @@ class CmdMask(Star):
 
     @filter.on_decorating_result(priority=100000)
     async def _override_reply(self, event: AstrMessageEvent):
-        if not event.get_extra(APPLIED_KEY, False):
-            return
-
-        mode = event.get_extra("__astrbot_plugin_cmdmask:reply_mode", "keep")
-        if mode == "keep":
+        decision = event.get_extra(REPLY_KEY)
+        if decision is None:
             return
 
+        mode, text = decision
         if mode == "silent":
             event.set_result(event.make_result())
             return
 
         if mode == "custom":
-            text = event.get_extra("__astrbot_plugin_cmdmask:reply_text", "")
             if not text or not str(text).strip():
                 event.set_result(event.make_result())
                 return